@@ -11,6 +11,7 @@ and some backends.
 import colorama
 import hashlib
 import os
+import shutil
 import sys
 import subprocess
 import grp
@@ -36,54 +37,102 @@ class Paths(object):
     """
     Initialises the paths for data files, configuration and caches.
     """
-    # Config/cache (XDG) directories
-    try:
-        config = os.path.join(os.environ["XDG_CONFIG_HOME"], ".config", "polychromatic")
-    except KeyError:
-        config = os.path.join(os.path.expanduser("~"), ".config", "polychromatic")
-
-    try:
-        cache = os.path.join(os.environ["XDG_CACHE_HOME"], ".cache", "polychromatic")
-    except KeyError:
-        cache = os.path.join(os.path.expanduser("~"), ".cache", "polychromatic")
-
-    # Cached directories
-    assets_cache = os.path.join(cache, "assets")
-    effects_cache = os.path.join(cache, "effects")
-
-    # Subdirectories
-    effects = os.path.join(config, "effects")
-    presets = os.path.join(config, "presets")
-    custom_icons = os.path.join(config, "custom_icons")
-    states = os.path.join(config, "states")
-
-    # Files
-    preferences = os.path.join(config, "preferences.json")
-    colours = os.path.join(config, "colours.json")
-
-    # Legacy (v0.3.12 and earlier)
-    old_profiles = os.path.join(config, "profiles.json")
-    old_profile_folder = os.path.join(config, "profiles")
-    old_profile_backups = os.path.join(config, "backups")
-    old_devicestate = os.path.join(config, "devicestate.json")
-
-    # Create folders if they do not exist.
-    for folder in [config, presets, custom_icons, states, effects,
-                   cache, assets_cache, effects_cache]:
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-
-    # Data directory
-    # -- For developmen/opt, this is normally adjacent to the application executable.
-    # -- For system-wide installs, this is generally /usr/share/polychromatic.
-    module_path = __file__
-    if os.path.exists(os.path.abspath(os.path.join(os.path.dirname(module_path), "../data/"))):
-        data_dir = os.path.abspath(os.path.join(os.path.dirname(module_path), "../data/"))
-    elif os.path.exists("/usr/share/polychromatic/"):
-        data_dir = "/usr/share/polychromatic/"
-    else:
-        print("Data directory cannot be located. Exiting.")
-        exit(1)
+    __slots__ = [
+        "config", "cache", "assets_cache", "effects_cache",
+        "effects", "presets", "custom_icons", "states",
+        "preferences", "colours",
+        "old_profiles", "old_profile_folder", "old_profile_backups", "old_devicestate",
+        "data_dir"
+    ]
+
+    def __init__(self):
+        home = os.path.expanduser("~")
+
+        # Config/cache (XDG) directories
+        self.config = os.path.join(os.environ.get("XDG_CONFIG_HOME") or os.path.join(home, ".config"), "polychromatic")
+        self.cache = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(home, ".cache"), "polychromatic")
+
+        # Cached directories
+        self.assets_cache = os.path.join(self.cache, "assets")
+        self.effects_cache = os.path.join(self.cache, "effects")
+
+        # Subdirectories
+        self.effects = os.path.join(self.config, "effects")
+        self.presets = os.path.join(self.config, "presets")
+        self.custom_icons = os.path.join(self.config, "custom_icons")
+        self.states = os.path.join(self.config, "states")
+
+        # Files
+        self.preferences = os.path.join(self.config, "preferences.json")
+        self.colours = os.path.join(self.config, "colours.json")
+
+        # Legacy (v0.3.12 and earlier)
+        self.old_profiles = os.path.join(self.config, "profiles.json")
+        self.old_profile_folder = os.path.join(self.config, "profiles")
+        self.old_profile_backups = os.path.join(self.config, "backups")
+        self.old_devicestate = os.path.join(self.config, "devicestate.json")
+
+        # Previous versions wrongly appended ".config" and ".cache" to the XDG variables.
+        for env_name, folder_name, new_path in [("XDG_CONFIG_HOME", ".config", self.config),
+                                                ("XDG_CACHE_HOME", ".cache", self.cache)]:
+            if os.environ.get(env_name):
+                self._migrate_folder(os.path.join(os.environ[env_name], folder_name, "polychromatic"), new_path)
+
+        # Create folders if they do not exist.
+        self._create_folders(self.config, [self.presets, self.custom_icons, self.states, self.effects])
+        self._create_folders(self.cache, [self.assets_cache, self.effects_cache])
+
+        # Data directory
+        # -- For developmen/opt, this is normally adjacent to the application executable.
+        # -- For system-wide installs, this is generally /usr/share/polychromatic.
+        dev_data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/"))
+        if os.path.exists(dev_data_dir):
+            self.data_dir = dev_data_dir
+        elif os.path.exists("/usr/share/polychromatic/"):
+            self.data_dir = "/usr/share/polychromatic/"
+        else:
+            print("Data directory cannot be located. Exiting.")
+            exit(1)
+
+    @staticmethod
+    def _migrate_folder(old_path, new_path):
+        """
+        Moves a folder from where a previous version stored it, unless data
+        already exists at the new location.
+
+        Messages go to stderr, as this runs on import and must not pollute
+        the output of the CLI.
+        """
+        if not os.path.isdir(old_path):
+            return
+
+        if os.path.exists(new_path):
+            print("Warning: Data from a previous version at '{0}' is no longer used. Now using: {1}".format(old_path, new_path), file=sys.stderr)
+            return
+
+        try:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            shutil.move(old_path, new_path)
+            print("Moved data from '{0}' to '{1}'".format(old_path, new_path), file=sys.stderr)
+        except OSError as e:
+            print("Warning: Could not move '{0}' to '{1}': {2}".format(old_path, new_path, str(e)), file=sys.stderr)
+
+    @staticmethod
+    def _create_folders(root, subfolders):
+        """
+        Creates the root folder and any of its direct subfolders that are missing.
+        Existing subfolders are found with a single directory listing.
+        """
+        try:
+            with os.scandir(root) as entries:
+                existing = {entry.name for entry in entries if entry.is_dir()}
+        except FileNotFoundError:
+            os.makedirs(root)
+            existing = set()
+
+        for folder in subfolders:
+            if os.path.basename(folder) not in existing:
+                os.makedirs(folder, exist_ok=True)
 
 
 class Debugging(object):
@@ -913,9 +913,8 @@ class IconPicker(object):
         self.callback_fn = callback_fn
         self.title = title
         self.purpose = purpose
-        self.custom_icon_exts = ["svg", "png", "jpg", "jpeg", "gif"]
         self.custom_icon_filters = [
-            self._("Image Files") + "(*.png *.jpg *.jpeg *.gif *.svg)",
+            self._("Image Files") + "(" + " ".join("*." + ext for ext in pref.CUSTOM_ICON_EXTS) + ")",
             self._("PNG Image") + " (*.png)",
             self._("JPEG Image") + " (*.jpg *.jpeg)",
             self._("GIF Image") + " (*.gif)",
@@ -970,7 +969,7 @@ class IconPicker(object):
         if not self.purpose == self.purpose_tray_icon_only:
             list_apps = self._get_application_icons()
             list_steam = self._get_steam_icons()
-        list_custom = glob.glob(common.paths.custom_icons + "/*")
+        list_custom = [os.path.join(common.paths.custom_icons, name) for name in pref.get_custom_icons()]
 
         # Populate icon tabs
         all_icon_buttons = []
@@ -1128,7 +1127,7 @@ class IconPicker(object):
         def dropEvent(event):
             uris = event.mimeData().urls()
             for uri in uris:
-                if uri.isLocalFile() and uri.path().split(".")[-1].lower() in self.custom_icon_exts:
+                if uri.isLocalFile() and uri.path().split(".")[-1].lower() in pref.CUSTOM_ICON_EXTS:
                     self.process_new_custom_icon(uri.path())
 
         self.tabs.setAcceptDrops(True)
@@ -9,15 +9,171 @@ This module is responsible for loading/saving persistent data used by Polychroma
 
 import os
 import json
+import mmap
 import shutil
+import types
 from . import common
 from . import locales
 
+# Optional: faster JSON parsing and serialization
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 VERSION = 7
 
 dbg = common.Debugging()
 path = common.paths
 
+# Preferences that must exist. Missing keys (or those with the wrong type)
+# are reset to these values when the file is loaded.
+_PREF_DEFAULTS = {
+    "colours": {
+        "primary": "#00FF00",
+        "secondary": "#FF0000"
+    },
+    "editor": {
+        "live_preview": True,
+        "system_cursors": False,
+        "suppress_confirm_dialog": False
+    },
+    "controller": {
+        "landing_tab": 0,
+        "show_menu_bar": True,
+        "system_qt_theme": False,
+        "window_behaviour": 0
+    },
+    "tray": {
+        "autostart": True,
+        "mode": 0,
+        "icon": common.get_default_tray_icon(),
+        "autostart_delay": 0
+    },
+    "geometry": {
+        "main_window_pos_x": 0,
+        "main_window_pos_y": 0,
+        "main_window_size_x": 1000,
+        "main_window_size_y": 600,
+        "editor_window_pos_x": 0,
+        "editor_window_pos_y": 0,
+        "editor_window_size_x": 1000,
+        "editor_window_size_y": 600
+    }
+}
+
+# Flattened from above as (group, item, type, default) for validating quickly.
+_PREF_SPEC = tuple(
+    (group, item, type(default_value), default_value)
+    for group, items in _PREF_DEFAULTS.items()
+    for item, default_value in items.items()
+)
+
+# Legacy (v0.3.12) built-in tray icons, mapped to their current paths.
+_OLD_TRAY_ICONS = types.MappingProxyType({
+    "0": "img/tray/light/humanity.svg",
+    "1": "img/tray/dark/humanity.svg",
+    "2": "img/tray/animated/chroma.gif",
+    "3": "img/tray/light/breeze.svg",
+    "4": "img/tray/dark/breeze.svg"
+})
+
+# Legacy (v0.3.12) default colours.json, which is discarded if unchanged.
+_OLD_COLOUR_JSON = types.MappingProxyType({
+    "1": {"name": "White", "col": [255, 255, 255]},
+    "2": {"name": "Red", "col": [255, 0, 0]},
+    "3": {"name": "Orange", "col": [255, 165, 0]},
+    "4": {"name": "Yellow", "col": [255, 255, 0]},
+    "5": {"name": "Signature Green", "col": [0, 255, 0]},
+    "6": {"name": "Aqua", "col": [0, 255, 255]},
+    "7": {"name": "Blue", "col": [0, 0, 255]},
+    "8": {"name": "Purple", "col": [128, 0, 128]},
+    "9": {"name": "Pink", "col": [255, 0, 255]}
+})
+
+# File extensions accepted as custom icons.
+CUSTOM_ICON_EXTS = ("svg", "png", "jpg", "jpeg", "gif")
+
+# Files larger than this (in bytes) are memory mapped instead of read.
+_MMAP_THRESHOLD = 64 * 1024
+
+
+def _read_mapped(filepath):
+    """
+    Parses a large JSON file directly from a memory map, saving a copy of the
+    whole file into a separate buffer. Requires orjson.
+
+    Falls back to reading the file normally if it can't be mapped, such as
+    when it was emptied since its size was checked, or the filesystem doesn't
+    support it.
+    """
+    with open(filepath, "rb") as stream:
+        try:
+            mm = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return orjson.loads(stream.read())
+
+        with mm:
+            # Python 3.8+ on Linux: read ahead, as the parser goes front to back.
+            if hasattr(mm, "madvise"):
+                for advice in ["MADV_SEQUENTIAL", "MADV_WILLNEED"]:
+                    if hasattr(mmap, advice):
+                        mm.madvise(getattr(mmap, advice))
+
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+
+
+def _read_file(filepath):
+    """
+    Returns the parsed contents of a JSON file.
+    """
+    if orjson and os.path.getsize(filepath) > _MMAP_THRESHOLD:
+        return _read_mapped(filepath)
+
+    if orjson:
+        with open(filepath, "rb") as stream:
+            return orjson.loads(stream.read())
+
+    with open(filepath, encoding="utf-8") as stream:
+        return json.load(stream)
+
+
+def _to_json(data):
+    """
+    Returns the data serialized as human-readable JSON, encoded in UTF-8.
+    Both serializers use the same indentation and key order, and convert
+    non-string keys to strings.
+    """
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, sort_keys=True, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def _has_valid_preferences(data):
+    """
+    Returns True if all the expected preferences are present with the correct
+    type, which is the case for nearly every load.
+
+    Types must match exactly, as isinstance() would accept booleans as integers.
+    """
+    return all(type(data.get(group)) is dict and type(data[group].get(item)) is data_type
+               for group, item, data_type, _ in _PREF_SPEC)
+
+
+def _validate_preferences(data):
+    """
+    Resets any preferences that are missing or not of the expected type.
+    """
+    for group, item, data_type, default_value in _PREF_SPEC:
+        values = data.get(group)
+        if type(values) is not dict:
+            values = data[group] = {}
+
+        if type(values.get(item)) is not data_type:
+            values[item] = default_value
+
+
 def load_file(filepath):
     """
     Loads a JSON file from disk. If empty, it will be created.
@@ -33,8 +189,7 @@ def load_file(filepath):
         data = {}
 
     try:
-        with open(filepath) as stream:
-            data = json.load(stream)
+        data = _read_file(filepath)
     except Exception as e:
         dbg.stdout(filepath + ": Read error!", dbg.error)
         dbg.stdout("Exception:\n" + common.get_exception_as_string(e), dbg.error)
@@ -42,49 +197,18 @@ def load_file(filepath):
         data = {}
 
     # Check preferences contain valid data and defaults.
-    def _validate(group, item, data_type, default_value):
-        try:
-            data[group]
-        except KeyError:
-            data[group] = {}
-
-        try:
-            data[group][item]
-        except KeyError:
-            data[group][item] = default_value
-            save_file(path.preferences, data)
-
-        if type(data[group][item]) != data_type:
-            data[group][item] = default_value
-            save_file(path.preferences, data)
-
-    if filepath == path.preferences:
-        _validate("colours", "primary", str, "#00FF00")
-        _validate("colours", "secondary", str, "#FF0000")
-        _validate("editor", "live_preview", bool, True)
-        _validate("editor", "system_cursors", bool, False)
-        _validate("editor", "suppress_confirm_dialog", bool, False)
-        _validate("controller", "landing_tab", int, 0)
-        _validate("controller", "show_menu_bar", bool, True)
-        _validate("controller", "system_qt_theme", bool, False)
-        _validate("controller", "window_behaviour", int, 0)
-        _validate("tray", "autostart", bool, True)
-        _validate("tray", "mode", int, 0)
-        _validate("tray", "icon", str, common.get_default_tray_icon())
-        _validate("tray", "autostart_delay", int, 0)
-
-        for prefix in ["main", "editor"]:
-            _validate("geometry", prefix + "_window_pos_x", int, 0)
-            _validate("geometry", prefix + "_window_pos_y", int, 0)
-            _validate("geometry", prefix + "_window_size_x", int, 1000)
-            _validate("geometry", prefix + "_window_size_y", int, 600)
+    if filepath == path.preferences and not _has_valid_preferences(data):
+        _validate_preferences(data)
+        save_file(path.preferences, data)
 
     return(data)
 
 
 def save_file(filepath, newdata):
     """
-    Commit data to the disk.
+    Commit data to the disk. The data is written to a temporary file first,
+    which then replaces the original so it is never left half written.
+    Symbolic links are followed and the file's permissions are kept.
 
     Params:
         filepath            String from the Path() object.
@@ -98,15 +222,36 @@ def save_file(filepath, newdata):
     if filepath == path.preferences:
         newdata["config_version"] = VERSION
 
-    if not os.path.exists(filepath):
-        open(filepath, "w").close()
+    new_json = _to_json(newdata)
 
-    if os.access(filepath, os.W_OK):
-        with open(filepath, "w+") as f:
-            f.write(json.dumps(newdata, sort_keys=True, indent=4))
-        return True
-    else:
+    # Skip writing if the file on disk already contains exactly this data.
+    try:
+        with open(filepath, "rb") as f:
+            if f.read() == new_json:
+                return True
+    except OSError:
+        pass
+
+    real_path = os.path.realpath(filepath)
+    tmp_path = "{0}.tmp.{1}".format(real_path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(new_json)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(real_path):
+            shutil.copymode(real_path, tmp_path)
+        os.replace(tmp_path, real_path)
+    except OSError as e:
+        dbg.stdout(filepath + ": Write error!", dbg.error)
+        dbg.stdout("Exception: " + str(e), dbg.error)
         return False
+    finally:
+        # Never leave the temporary file behind, whatever went wrong.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return True
 
 
 def init_config(filepath):
@@ -133,9 +278,9 @@ def upgrade_old_pref():
     """
     Checks and updates the configuration from previous revisions.
     """
+    # Upgrades work on the file as-is, without validation (or defaults).
     try:
-        with open(path.preferences, "r") as f:
-            data = json.load(f)
+        data = _read_file(path.preferences)
         config_version = int(data["config_version"])
     except Exception:
         # Never mind, the parent function should fix this later.
@@ -165,19 +310,12 @@ def upgrade_old_pref():
     # v0.3.12
     if config_version < 5:
         # Ensure preferences.json is clean.
-        data = load_file(path.preferences)
-        for key in ["activate_on_save", "live_switch", "live_preview"]:
-            try:
-                value = data["editor"][key]
+        editor = data.get("editor")
+        if type(editor) is dict:
+            for key in ["activate_on_save", "live_switch", "live_preview"]:
+                value = editor.get(key)
                 if type(value) == str:
-                    if value in ['true', 'True']:
-                        data["editor"][key] = True
-                    else:
-                        data["editor"][key] = False
-            except Exception:
-                pass
-
-        save_file(path.preferences, data)
+                    editor[key] = value in ['true', 'True']
 
     # v0.4.0 (dev)
     if config_version == 6:
@@ -191,7 +329,7 @@ def upgrade_old_pref():
     # v0.5.0 (dev)
     if config_version < 7:
         # Migrate preferences.json to new keys
-        old_data = load_file(path.preferences)
+        old_data = data
 
         # -- Tray icon is now one key (a relative or absolute path)
         new_tray_value = ""
@@ -219,37 +357,30 @@ def upgrade_old_pref():
             else:
                 return ""
 
-        try:
-            old_type = old_data["tray_icon"]["type"]
-            if old_type == "gtk":
-                new_tray_value = get_path_from_gtk_icon_name(old_data["tray_icon"]["value"])
-            elif old_type == "custom":
-                new_tray_value = old_data["tray_icon"]["value"]
-            elif old_type == "builtin":
-                try:
-                    mapping = {
-                        "0": "img/tray/light/humanity.svg",
-                        "1": "img/tray/dark/humanity.svg",
-                        "2": "img/tray/animated/chroma.gif",
-                        "3": "img/tray/light/breeze.svg",
-                        "4": "img/tray/dark/breeze.svg"
-                    }
-                    new_tray_value = mapping[old_data["tray_icon"]["value"]]
-                except KeyError:
-                    # Invalid data, discard.
-                    pass
-        except ImportError:
-            dbg.stdout("GTK not installed. Tray icon cannot be migrated.", dbg.error)
-        except KeyError:
-            # Invalid data, discard.
+        # Invalid or missing data is discarded.
+        old_tray_icon = old_data.get("tray_icon")
+        if type(old_tray_icon) is not dict:
+            old_tray_icon = {}
+        old_type = old_tray_icon.get("type")
+        old_value = old_tray_icon.get("value")
+        if old_value is None:
             pass
-
-        try:
-            old_live_preview = old_data["editor"]["live_preview"]
-        except KeyError:
-            old_live_preview = False
-
-        new_data = {
+        elif old_type == "gtk":
+            try:
+                new_tray_value = get_path_from_gtk_icon_name(old_value)
+            except ImportError:
+                dbg.stdout("GTK not installed. Tray icon cannot be migrated.", dbg.error)
+        elif old_type == "custom":
+            new_tray_value = old_value
+        elif old_type == "builtin":
+            new_tray_value = _OLD_TRAY_ICONS.get(old_value, "")
+
+        old_editor = old_data.get("editor")
+        if type(old_editor) is not dict:
+            old_editor = {}
+        old_live_preview = old_editor.get("live_preview", _PREF_DEFAULTS["editor"]["live_preview"])
+
+        data = {
             "colours": {
                 "primary": "#00FF00",               # New
                 "secondary": "#00FFFF"              # New
@@ -262,28 +393,13 @@ def upgrade_old_pref():
             }
         }
 
-        os.remove(path.preferences)
-        save_file(path.preferences, new_data)
-
         # devicestate.json now obsolete
         if os.path.exists(path.old_devicestate):
             os.remove(path.old_devicestate)
 
         # If the colours were unchanged from v0.3.12, reset to new ones.
         old_colours = load_file(path.colours)
-        old_colour_json = {
-            "1": {"name": "White", "col": [255, 255, 255]},
-            "2": {"name": "Red", "col": [255, 0, 0]},
-            "3": {"name": "Orange", "col": [255, 165, 0]},
-            "4": {"name": "Yellow", "col": [255, 255, 0]},
-            "5": {"name": "Signature Green", "col": [0, 255, 0]},
-            "6": {"name": "Aqua", "col": [0, 255, 255]},
-            "7": {"name": "Blue", "col": [0, 0, 255]},
-            "8": {"name": "Purple", "col": [128, 0, 128]},
-            "9": {"name": "Pink", "col": [255, 0, 255]}
-        }
-
-        if old_colours == old_colour_json:
+        if old_colours == _OLD_COLOUR_JSON:
             os.remove(path.colours)
         else:
             # Migrate colours from RGB lists to hex strings.
@@ -298,11 +414,8 @@ def upgrade_old_pref():
 
                 save_file(path.colours, new_colours)
 
-
-
-    # Write new version number.
-    data = load_file(path.preferences)
-    data["config_version"] = VERSION
+    # Write the upgraded preferences (and new version number) in one go.
+    _validate_preferences(data)
     save_file(path.preferences, data)
 
     dbg.stdout("Configuration successfully upgraded.", dbg.success)
@@ -313,19 +426,19 @@ def get_custom_icons():
     Returns a list of all the icons currently stored in the user's "custom icons"
     folder. This is used by the icon picker. Save data will reference images
     by a relative file name.
+
+    Only regular, non-hidden files with an image extension are included.
     """
-    return os.listdir(path.custom_icons)
+    with os.scandir(path.custom_icons) as entries:
+        return [entry.name for entry in entries
+                if not entry.name.startswith(".") and entry.is_file()
+                and entry.name.rpartition(".")[2].lower() in CUSTOM_ICON_EXTS]
 
 
 def init(_):
     """
     Prepares the preferences module.
     """
-    # Create preferences if non-existent.
-    for json_path in [path.preferences]:
-        if not os.path.exists(json_path):
-            init_config(json_path)
-
     # Check the configuration and software version matches.
     upgrade_old_pref()
 
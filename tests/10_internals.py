@@ -9,8 +9,12 @@ import pylib.locales as locales
 import pylib.preferences as preferences
 import pylib.procpid as procpid
 
+import json
 import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
 class PolychromaticTests(unittest.TestCase):
     """
@@ -77,9 +81,128 @@ class PolychromaticTests(unittest.TestCase):
         data = preferences.load_file(self.paths.preferences)
         self.assertFalse(data["controller"]["system_qt_theme"], "Invalid data was not corrected")
 
+    def test_config_save_keeps_symlink_and_mode(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        real_path = os.path.join(temp_dir, "colours.json")
+        preferences.save_file(real_path, [])
+        os.chmod(real_path, 0o600)
+
+        os.remove(self.paths.colours)
+        os.symlink(real_path, self.paths.colours)
+        self.addCleanup(os.remove, self.paths.colours)
+
+        new_colours = [{"name": "Custom", "hex": "#123456"}]
+        preferences.save_file(self.paths.colours, new_colours)
+        self.assertTrue(os.path.islink(self.paths.colours), "Symbolic link was replaced by a file")
+        self.assertEqual(preferences.load_file(real_path), new_colours, "Symbolic link target was not written")
+        self.assertEqual(os.stat(real_path).st_mode & 0o777, 0o600, "File permissions were not kept")
+
+    def _write_old_config(self, prefs, colours):
+        with open(self.paths.preferences, "w") as f:
+            f.write(json.dumps(prefs))
+        with open(self.paths.colours, "w") as f:
+            f.write(json.dumps(colours))
+        preferences.init(self._)
+
+    def test_config_upgrade_from_v3(self):
+        self._write_old_config({
+            "config_version": 3,
+            "editor": {"live_preview": "false"},
+            "tray_icon": {"type": "builtin", "value": "3"}
+        }, {
+            "1": {"name": "White", "col": [255, 255, 255]},
+            "2": {"name": "Red", "col": [255, 0, 0]},
+            "3": {"name": "Blue", "col": [0, 0, 255]}
+        })
+
+        data = preferences.load_file(self.paths.preferences)
+        self.assertEqual(data["config_version"], preferences.VERSION, "Config version was not upgraded")
+        self.assertEqual(data["tray"]["icon"], "img/tray/light/breeze.svg", "Tray icon was not migrated")
+        self.assertFalse(data["editor"]["live_preview"], "Live preview string was not migrated")
+        self.assertNotIn("tray_icon", data, "Old tray icon key was not removed")
+
+        colours = preferences.load_file(self.paths.colours)
+        self.assertEqual(colours, [
+            {"name": "White", "hex": "#FFFFFF"},
+            {"name": "Red", "hex": "#FF0000"},
+            {"name": "Blue", "hex": "#0000FF"}
+        ], "Custom colours were not migrated")
+
+    def test_config_upgrade_from_v5(self):
+        old_colours = {}
+        for index, name, rgb in [("1", "White", [255, 255, 255]), ("2", "Red", [255, 0, 0]),
+                                 ("3", "Orange", [255, 165, 0]), ("4", "Yellow", [255, 255, 0]),
+                                 ("5", "Signature Green", [0, 255, 0]), ("6", "Aqua", [0, 255, 255]),
+                                 ("7", "Blue", [0, 0, 255]), ("8", "Purple", [128, 0, 128]),
+                                 ("9", "Pink", [255, 0, 255])]:
+            old_colours[index] = {"name": name, "col": rgb}
+
+        self._write_old_config({
+            "config_version": 5,
+            "editor": {"live_preview": True},
+            "tray_icon": {"type": "custom", "value": "/path/to/icon.png"}
+        }, old_colours)
+
+        data = preferences.load_file(self.paths.preferences)
+        self.assertEqual(data["config_version"], preferences.VERSION, "Config version was not upgraded")
+        self.assertEqual(data["tray"]["icon"], "/path/to/icon.png", "Custom tray icon was not migrated")
+        self.assertTrue(data["editor"]["live_preview"], "Live preview was not migrated")
+
+        colours = preferences.load_file(self.paths.colours)
+        self.assertEqual(len(colours), 12, "Unchanged old colours were not replaced with new defaults")
+
+    def test_config_upgrade_discards_malformed_data(self):
+        for version in [3, 5]:
+            self._write_old_config({
+                "config_version": version,
+                "editor": "x",
+                "tray_icon": "abc"
+            }, [])
+
+            data = preferences.load_file(self.paths.preferences)
+            self.assertEqual(data["config_version"], preferences.VERSION, "Config version was not upgraded")
+            self.assertTrue(data["editor"]["live_preview"], "Malformed editor data was not discarded")
+            self.assertEqual(data["tray"]["icon"], "", "Malformed tray icon data was not discarded")
+
+    def test_config_upgrade_from_v6_resets(self):
+        self._write_old_config({
+            "config_version": 6,
+            "controller": {"landing_tab": 2},
+            "tray": {"icon": "/path/to/icon.png"}
+        }, [{"name": "Custom", "hex": "#123456"}])
+
+        data = preferences.load_file(self.paths.preferences)
+        self.assertEqual(data["config_version"], preferences.VERSION, "Config version was not reset")
+        self.assertEqual(data["controller"]["landing_tab"], 0, "Preferences were not reset")
+        self.assertEqual(data["tray"]["icon"], common.get_default_tray_icon(), "Preferences were not reset")
+        self.assertEqual(len(preferences.load_file(self.paths.colours)), 12, "Colours were not reset")
+
     def test_data_path(self):
         self.assertTrue(self.paths.data_dir.endswith("/data"), "Unexpected development data directory path")
 
+    def test_paths_xdg_base_dirs(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        with mock.patch.dict(os.environ, {"XDG_CONFIG_HOME": os.path.join(temp_dir, "config"),
+                                          "XDG_CACHE_HOME": os.path.join(temp_dir, "cache")}):
+            paths = common.Paths()
+        self.assertEqual(paths.config, os.path.join(temp_dir, "config", "polychromatic"), "Unexpected config path with XDG_CONFIG_HOME")
+        self.assertEqual(paths.cache, os.path.join(temp_dir, "cache", "polychromatic"), "Unexpected cache path with XDG_CACHE_HOME")
+
+    def test_paths_xdg_migrate_old_folder(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        old_presets = os.path.join(temp_dir, "config", ".config", "polychromatic", "presets")
+        os.makedirs(old_presets)
+        open(os.path.join(old_presets, "preset.json"), "w").close()
+
+        with mock.patch.dict(os.environ, {"XDG_CONFIG_HOME": os.path.join(temp_dir, "config"),
+                                          "XDG_CACHE_HOME": os.path.join(temp_dir, "cache")}):
+            paths = common.Paths()
+        self.assertTrue(os.path.exists(os.path.join(paths.presets, "preset.json")), "Config from the old XDG path was not moved")
+        self.assertFalse(os.path.exists(old_presets), "Config at the old XDG path was not removed")
+
     def test_get_form_factor(self):
         ff = common.get_form_factor(self._, "keyboard")
         self.assertEqual(list(ff.keys()), ["id", "icon", "label"], "Unexpected get_form_factor() output")